@@ -4,14 +4,23 @@ from utils import (
     get_sections,
     clean_text,
     get_similar_sentences,
+    tokenize,
+    REQUIREMENT_WORDS,
 )
+from storage import hash_page, map_pages
+from collections import Counter
+from difflib import SequenceMatcher
 import pandas as pd
 import streamlit as st
-from sklearn.feature_extraction.text import CountVectorizer
 import re
+import os
 import json
+import heapq
+import math
 
-stop = json.load(open("stop.json"))
+stop = set(json.load(open(os.path.join(os.path.dirname(__file__), "stop.json"))))
+MAX_ASSOCIATED_TERMS = 5000
+MIN_CHANGE_RATIO = 0.6  # Removed and added clauses at least this similar are changes
 
 
 @st.cache(allow_output_mutation=True)
@@ -61,6 +70,11 @@ def get_money(pages, sections=None):
     return pd.DataFrame(all_matches)
 
 
+def _find_word(page, word):
+    """Get the sentences of a page containing a word"""
+    return [i for i in clean_pdf_page(page) if word in i.lower()]
+
+
 @st.cache(allow_output_mutation=True)
 def get_words_in_sentances(pages, words, sections=None):
 
@@ -78,52 +92,221 @@ def get_words_in_sentances(pages, words, sections=None):
     for word in words:
         all_matches = []
 
-        for page_ind, page in enumerate(pages):
-            clean_page = clean_pdf_page(page)
-            for sentance in clean_page:
-                if word in sentance.lower():
-                    d = {"Sentance": sentance, "Page": page_ind + 1}
+        # Only the requirement words are saved, not every query
+        page_matches = map_pages(
+            _find_word, pages, word, store=word in REQUIREMENT_WORDS
+        )
+        for page_ind, matches in enumerate(page_matches):
+            for sentance in matches:
+                d = {"Sentance": sentance, "Page": page_ind + 1}
 
-                    if sections is not None:
-                        d["Section"] = sections[page_ind + 1]
-                    all_matches.append(d)
+                if sections is not None:
+                    d["Section"] = sections[page_ind + 1]
+                all_matches.append(d)
 
         outputs[word] = pd.DataFrame(all_matches)
 
     return outputs
 
 
-@st.cache(allow_output_mutation=True)
-def get_associated_words(pages, words, sections=None):
+def _tokenize_page(page):
+    """Get the set of tokens of every non empty sentence of a page"""
+    page_tokens = []
+    for sentance in clean_pdf_page(page):
+        tokens = set(tokenize(sentance))
+        if tokens:
+            page_tokens.append(tokens)
+    return page_tokens
+
+
+def _prune_counter(counter, max_terms):
+    """Keep only the max_terms most frequent entries of a counter (in place)."""
+    if len(counter) > max_terms:
+        keep = dict(heapq.nlargest(max_terms, counter.items(), key=lambda x: x[1]))
+        counter.clear()
+        counter.update(keep)
+
+
+def _to_stats(
+    vocab, sentance_count, term_counts, pair_counts, target_counts, max_terms
+):
+    """Pack co-occurrence counters into a JSON serializable dictionary."""
+    for counter in pair_counts.values():
+        _prune_counter(counter, max_terms)
+
+    return {
+        "vocab": sorted(vocab, key=vocab.get),
+        "sentances": sentance_count,
+        "term_counts": [term_counts[i] for i in range(len(vocab))],
+        "targets": {
+            word: {"sentances": target_counts[word], "pairs": sorted(counter.items())}
+            for word, counter in pair_counts.items()
+        },
+    }
+
+
+@st.cache
+def count_cooccurrences(pages, words, max_terms=MAX_ASSOCIATED_TERMS):
+    """Count the words co-occurring in the same sentence as each of the given words.
+
+    Counts are kept per sentence and keyed on token ids, so memory is bounded by the
+    vocabulary of the file. The counts are exact, only the max_terms most frequent
+    partners of each word are kept once the whole file was counted.
 
-    """Get all words in the words parameter
-    
     Arguments:
         pages {list} -- list of pages
         words {list} -- list of words
-    
+
+    Keyword Arguments:
+        max_terms {int} -- maximum number of associated terms kept per word
+
     Returns:
-        dict -- Dictionary containing the results of the query in the foramt {Word:DataFrame}
+        dict -- Co-occurrence statistics, see merge_cooccurrences to combine several
     """
     words = [w.strip().lower() for w in words]
-    outputs = {}
-    for word in words:
-        all_matches = []
+    vocab = {}
+    term_counts = Counter()
+    pair_counts = {word: Counter() for word in words}
+    target_counts = Counter()
+    sentance_count = 0
 
-        for page_ind, page in enumerate(pages):
-            clean_page = clean_pdf_page(page)
-            for sentance in clean_page:
-                if word in sentance.lower():
-                    sentance_words = [
-                        i
-                        for i in sentance.lower().split()
-                        if i != word and i not in stop
-                    ]
-                    all_matches.extend(sentance_words)
+    for page_tokens in map_pages(_tokenize_page, pages):
+        for tokens in page_tokens:
+            sentance_count += 1
+            ids = [vocab.setdefault(t, len(vocab)) for t in tokens if t not in stop]
+            term_counts.update(ids)
 
-        outputs[word] = pd.Series(all_matches).value_counts()
+            for word in words:
+                if word not in tokens:
+                    continue
+                target_counts[word] += 1
+                word_id = vocab.get(word)
+                counter = pair_counts[word]
+                counter.update(i for i in ids if i != word_id)
 
-    return outputs
+    return _to_stats(
+        vocab, sentance_count, term_counts, pair_counts, target_counts, max_terms
+    )
+
+
+def merge_cooccurrences(all_stats, max_terms=MAX_ASSOCIATED_TERMS):
+    """Merge the co-occurrence statistics of several files (e.g. a whole class).
+
+    Each file only holds its max_terms most frequent partners of every word, so a
+    partner outside of that list in some files is undercounted in the merged counts.
+
+    Arguments:
+        all_stats {list} -- list of statistics returned by count_cooccurrences
+
+    Keyword Arguments:
+        max_terms {int} -- maximum number of associated terms kept per word
+
+    Returns:
+        dict -- Merged co-occurrence statistics
+    """
+    vocab = {}
+    term_counts = Counter()
+    pair_counts = {}
+    target_counts = Counter()
+    sentance_count = 0
+
+    for stats in all_stats:
+        id_map = [vocab.setdefault(t, len(vocab)) for t in stats["vocab"]]
+        sentance_count += stats["sentances"]
+        for old_id, count in enumerate(stats["term_counts"]):
+            term_counts[id_map[old_id]] += count
+        for word, target in stats["targets"].items():
+            target_counts[word] += target["sentances"]
+            counter = pair_counts.setdefault(word, Counter())
+            for old_id, count in target["pairs"]:
+                counter[id_map[old_id]] += count
+
+    return _to_stats(
+        vocab, sentance_count, term_counts, pair_counts, target_counts, max_terms
+    )
+
+
+def _pmi(pair_count, word_count, term_count, total):
+    return math.log((pair_count * total) / (word_count * term_count))
+
+
+def _log_likelihood(pair_count, word_count, term_count, total):
+    """Dunning's log-likelihood ratio (G2) of the 2x2 contingency table."""
+    cells = [
+        (pair_count, word_count, term_count),
+        (word_count - pair_count, word_count, total - term_count),
+        (term_count - pair_count, total - word_count, term_count),
+        (
+            total - word_count - term_count + pair_count,
+            total - word_count,
+            total - term_count,
+        ),
+    ]
+    g2 = 2 * sum(
+        k * math.log(k * total / (row * col)) for k, row, col in cells if k > 0
+    )
+    return g2 if pair_count * total >= word_count * term_count else -g2
+
+
+SCORERS = {
+    "count": lambda pair_count, word_count, term_count, total: pair_count,
+    "pmi": _pmi,
+    "log-likelihood": _log_likelihood,
+}
+
+
+def top_associated_words(stats, word, k=25, score="count", min_count=2):
+    """Get the k words most associated with a word from co-occurrence statistics.
+
+    Arguments:
+        stats {dict} -- statistics returned by count_cooccurrences or merge_cooccurrences
+        word {str} -- word to find the associated words of
+
+    Keyword Arguments:
+        k {int} -- number of words to return
+        score {str} -- one of "count", "pmi" or "log-likelihood"
+        min_count {int} -- minimum number of co-occurrences for a word to be scored
+
+    Returns:
+        DataFrame -- Dataframe of the associated words, their count and score
+    """
+    scorer = SCORERS[score]
+    target = stats["targets"].get(word.strip().lower())
+    if target is None or target["sentances"] == 0:
+        return pd.DataFrame(columns=["Word", "Count", "Score"])
+
+    total = stats["sentances"]
+    term_counts = stats["term_counts"]
+    scored = (
+        (scorer(count, target["sentances"], term_counts[i], total), count, i)
+        for i, count in target["pairs"]
+        if count >= min_count
+    )
+    top = heapq.nlargest(k, scored)
+    return pd.DataFrame(
+        [(stats["vocab"][i], count, round(val, 3)) for val, count, i in top],
+        columns=["Word", "Count", "Score"],
+    )
+
+
+def get_associated_words(pages, words, stats=None, k=25, score="count"):
+    """Get the words most associated with each word in the words parameter
+    
+    Arguments:
+        pages {list} -- list of pages
+        words {list} -- list of words
+
+    Keyword Arguments:
+        stats {dict} -- precomputed co-occurrence statistics (default: computed from pages)
+        k {int} -- number of associated words to return per word
+        score {str} -- one of "count", "pmi" or "log-likelihood"
+    
+    Returns:
+        dict -- Dictionary containing the results of the query in the foramt {Word:DataFrame}
+    """
+    if stats is None:
+        stats = count_cooccurrences(pages, words)
+    return {word: top_associated_words(stats, word, k, score) for word in words}
 
 
 @st.cache
@@ -186,6 +369,8 @@ def get_frequent_words(pages):
     Returns:
         dict -- Dictionary containing the section namea and values inside
     """
+    from sklearn.feature_extraction.text import CountVectorizer
+
     sections, _ = get_sections(pages)
     sections = {key: clean_text(" ".join(val)) for key, val in sections.items()}
 
@@ -249,3 +434,87 @@ def run_query(pages, sections, all_queries):
                     section_scores[section] += qs
 
     return pd.Series(section_scores).to_frame("Weight"), specific_section_scores
+
+
+def _find_requirements(page, words):
+    """Get the sentences of a page containing one of the words as a whole word"""
+    words = set(words)
+    return [i for i in clean_pdf_page(page) if words.intersection(tokenize(i))]
+
+
+def _changed_requirements(pages, unchanged, words):
+    unchanged = Counter(unchanged)
+    changed = []
+    for page_ind, page in enumerate(pages):
+        page_hash = hash_page(page)
+        if unchanged[page_hash] > 0:
+            unchanged[page_hash] -= 1
+        else:
+            changed.append(page_ind)
+    found = map_pages(_find_requirements, [pages[i] for i in changed], words)
+    return [
+        (sentance, page_ind + 1)
+        for page_ind, sentances in zip(changed, found)
+        for sentance in sentances
+    ]
+
+
+def _subtract_requirements(requirements, other):
+    counts = Counter(sentance for sentance, _ in other)
+    remaining = []
+    for sentance, page in requirements:
+        if counts[sentance] > 0:
+            counts[sentance] -= 1
+        else:
+            remaining.append((sentance, page))
+    return remaining
+
+
+@st.cache
+def get_requirement_diff(old_pages, new_pages, words):
+    """Find the requirements added, removed or changed between two revisions of a file
+
+    Only the pages whose content changed between the revisions are searched, a page
+    repeated more times in one revision than in the other counts as changed.
+
+    Arguments:
+        old_pages {list} -- list of pages of the old revision
+        new_pages {list} -- list of pages of the new revision
+        words {list} -- list of words marking a requirement
+
+    Returns:
+        dict -- Dictionary in the format {Change: DataFrame}
+    """
+    words = tuple(sorted({w.strip().lower() for w in words}))  # Stable result key
+    unchanged = Counter(map(hash_page, old_pages)) & Counter(map(hash_page, new_pages))
+    old = _changed_requirements(old_pages, unchanged, words)
+    new = _changed_requirements(new_pages, unchanged, words)
+    removed = _subtract_requirements(old, new)
+    added = _subtract_requirements(new, old)
+
+    changed = []
+    for old_sentance, old_page in list(removed):
+        best, best_ratio = None, MIN_CHANGE_RATIO
+        for new_sentance, new_page in added:
+            matcher = SequenceMatcher(None, old_sentance, new_sentance)
+            if matcher.quick_ratio() >= best_ratio and matcher.ratio() >= best_ratio:
+                best, best_ratio = (new_sentance, new_page), matcher.ratio()
+        if best is not None:
+            removed.remove((old_sentance, old_page))
+            added.remove(best)
+            changed.append((old_sentance, old_page) + best + (round(best_ratio, 3),))
+
+    return {
+        "added": pd.DataFrame(added, columns=["Sentance", "Page"]),
+        "removed": pd.DataFrame(removed, columns=["Sentance", "Page"]),
+        "changed": pd.DataFrame(
+            changed,
+            columns=[
+                "Old Sentance",
+                "Old Page",
+                "New Sentance",
+                "New Page",
+                "Similarity",
+            ],
+        ),
+    }
@@ -0,0 +1,436 @@
+import uuid
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import Normalizer
+from utils import clean_pdf_page, tokenize
+import storage
+
+N_COMPONENTS = 128  # Size of the sentence vectors
+N_PROBE = 4  # Number of index lists searched for every query
+MIN_WORDS = 3  # Shorter lines (page numbers, headers) are not encoded
+REFIT_GROWTH = 1.5  # Refit the encoder once the catalog grew by this factor
+
+_encoder = {}
+_corpus = {}
+_corpus_index = {}
+
+
+def get_sentances(pages):
+    """Get the sentences of a list of pages that are long enough to be encoded
+
+    Arguments:
+        pages {list} -- list of pages
+
+    Returns:
+        DataFrame -- Dataframe of the sentences and their page
+    """
+    all_matches = []
+    for page_ind, page in enumerate(pages):
+        for sentance in _page_sentances(page):
+            all_matches.append({"Sentance": sentance, "Page": page_ind + 1})
+    return pd.DataFrame(all_matches, columns=["Sentance", "Page"])
+
+
+def _page_sentances(page):
+    return [i for i in clean_pdf_page(page) if len(tokenize(i)) >= MIN_WORDS]
+
+
+def fit_encoder(sentances, n_components=N_COMPONENTS):
+    """Fit a TF-IDF + truncated SVD model mapping sentences to dense unit vectors
+
+    Arguments:
+        sentances {list} -- list of sentences to fit the model on
+
+    Keyword Arguments:
+        n_components {int} -- size of the sentence vectors
+
+    Returns:
+        Pipeline -- scikit-learn pipeline encoding sentences
+
+    Raises:
+        ValueError -- if there are not enough sentences or words to fit the model
+    """
+    tfidf = TfidfVectorizer(stop_words="english", sublinear_tf=True)
+    features = tfidf.fit_transform(sentances)  # Raises on an empty vocabulary
+    if min(features.shape) < 2:
+        raise ValueError("at least two sentences and two words are needed")
+    svd = TruncatedSVD(n_components=min(n_components, min(features.shape) - 1))
+    svd.fit(features)
+    return make_pipeline(tfidf, svd, Normalizer())
+
+
+def encode(encoder, sentances):
+    """Encode sentences into float32 unit vectors
+
+    Arguments:
+        encoder {Pipeline} -- pipeline returned by fit_encoder
+        sentances {list} -- list of sentences
+
+    Returns:
+        np.ndarray -- Array of shape (sentences, components)
+    """
+    n_components = encoder.steps[1][1].components_.shape[0]
+    if len(sentances) == 0:
+        return np.zeros((0, n_components), dtype=np.float32)
+    return encoder.transform(sentances).astype(np.float32)
+
+
+def build_index(vectors, n_lists=None):
+    """Build an inverted file index (IVF) to find approximate nearest neighbours.
+
+    The vectors are clustered with k-means and a query is only compared with the
+    vectors of the N_PROBE clusters closest to it.
+
+    Arguments:
+        vectors {np.ndarray} -- unit vectors to index
+
+    Keyword Arguments:
+        n_lists {int} -- number of clusters (default: square root of the vectors)
+
+    Returns:
+        dict -- Index to use with search_index
+    """
+    if len(vectors) == 0:
+        return {"vectors": vectors, "centroids": vectors, "lists": []}
+
+    n_lists = min(n_lists or int(np.sqrt(len(vectors))), len(vectors))
+    kmeans = MiniBatchKMeans(n_clusters=max(1, n_lists), random_state=0)
+    labels = kmeans.fit_predict(vectors)
+    centroids = kmeans.cluster_centers_
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return {
+        "vectors": vectors,
+        "centroids": centroids.astype(np.float32),
+        "lists": [np.nonzero(labels == i)[0] for i in range(len(centroids))],
+    }
+
+
+def search_index(index, queries, n_probe=N_PROBE):
+    """Find the closest indexed vector of every query
+
+    Arguments:
+        index {dict} -- index returned by build_index
+        queries {np.ndarray} -- unit vectors to search for
+
+    Keyword Arguments:
+        n_probe {int} -- number of clusters searched for every query
+
+    Returns:
+        tuple -- Cosine similarities and indexed vector ids (-1 if none were found)
+    """
+    best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+    best_ids = np.full(len(queries), -1)
+    if len(queries) == 0 or not index["lists"]:
+        return best_scores, best_ids
+
+    n_probe = min(n_probe, len(index["lists"]))
+    probes = np.argsort(-queries @ index["centroids"].T, axis=1)[:, :n_probe]
+
+    for list_id, members in enumerate(index["lists"]):
+        query_ids = np.nonzero((probes == list_id).any(axis=1))[0]
+        if len(query_ids) == 0 or len(members) == 0:
+            continue
+        scores = queries[query_ids] @ index["vectors"][members].T
+        top = scores.argmax(axis=1)
+        top_scores = scores[np.arange(len(query_ids)), top]
+        better = top_scores > best_scores[query_ids]
+        best_scores[query_ids[better]] = top_scores[better]
+        best_ids[query_ids[better]] = members[top[better]]
+
+    return best_scores, best_ids
+
+
+def get_encoder(pages=None):
+    """Get the sentence encoder shared by every file
+
+    The encoder is fitted on the stored files, and refitted once the catalog grew
+    well beyond the files it was fitted on so the vocabulary of new files is known.
+
+    Keyword Arguments:
+        pages {list} -- pages of the current file, also used to fit the encoder
+
+    Returns:
+        dict -- Dictionary in the format {"id": str, "model": Pipeline, "files": int},
+            None if there is not enough text to fit it
+    """
+    names = storage.load_file_names()
+    encoder = _encoder.get("encoder") or storage.load_encoder()
+    if encoder is None or len(names) > encoder.get("files", 0) * REFIT_GROWTH:
+        sentances = list(get_sentances(pages or [])["Sentance"])
+        for name in names:
+            file_pages = storage.load_pages(name) or []
+            sentances.extend(get_sentances(file_pages)["Sentance"])
+        try:
+            model = fit_encoder(sentances)
+        except ValueError:
+            return encoder  # Keep the previous encoder, if any, until a refit works
+        encoder = {"id": uuid.uuid4().hex, "model": model, "files": len(names)}
+        storage.clear_vectors()
+        storage.clear_page_results(_encode_pages)
+        storage.save_encoder(encoder)
+    _encoder["encoder"] = encoder
+    return encoder
+
+
+def _load_file_vectors(name, encoder):
+    data = storage.load_vectors(name)
+    if data is None or str(data["encoder"]) != encoder["id"]:
+        return None
+    sentances = pd.DataFrame({"Sentance": data["sentances"], "Page": data["pages"]})
+    return sentances, data["vectors"]
+
+
+def _encode_pages(pages, encoder_id):
+    """Get the sentences of every page long enough to be encoded and their vectors
+
+    The encoder_id keys the saved results, the pages are encoded at once with the
+    current encoder returned by get_encoder.
+    """
+    page_sentances = [_page_sentances(i) for i in pages]
+    vectors = encode(
+        _encoder["encoder"]["model"], [j for i in page_sentances for j in i]
+    )
+    splits = np.cumsum([len(i) for i in page_sentances])[:-1]
+    return list(zip(page_sentances, np.split(vectors, splits)))
+
+
+def get_file_vectors(name, pages, encoder):
+    """Get the sentences of a file and their vectors, saved with the file when stored
+
+    The vectors are saved for every page, so only the pages changed in a new revision
+    of the file are encoded again.
+
+    Arguments:
+        name {str} -- Name of the file
+        pages {list} -- list of pages of the file
+        encoder {dict} -- encoder returned by get_encoder
+
+    Returns:
+        tuple -- Dataframe of the sentences and array of their vectors
+    """
+    stored = storage.load_pages(name) == pages
+    if stored:
+        loaded = _load_file_vectors(name, encoder)
+        if loaded is not None:
+            return loaded
+
+    page_vectors = storage.map_pages(
+        _encode_pages, pages, encoder["id"], batched=True
+    )
+    sentances = pd.DataFrame(
+        [
+            {"Sentance": sentance, "Page": page_ind + 1}
+            for page_ind, (page_sentances, _) in enumerate(page_vectors)
+            for sentance in page_sentances
+        ],
+        columns=["Sentance", "Page"],
+    )
+    vectors = np.vstack([encode(encoder["model"], [])] + [i[1] for i in page_vectors])
+    if stored:
+        storage.save_vectors(
+            name,
+            encoder=np.array(encoder["id"]),
+            sentances=np.array(sentances["Sentance"].tolist(), dtype=str),
+            pages=sentances["Page"].values,
+            vectors=vectors,
+        )
+    return sentances, vectors
+
+
+def _corpus_key(names, encoder):
+    return (encoder["id"],) + tuple((i, storage.vectors_version(i)) for i in names)
+
+
+def get_corpus_vectors(names, encoder):
+    """Get the sentences and sentence vectors of several stored files
+
+    They are kept in memory until the vectors of one of the files change.
+
+    Arguments:
+        names {list} -- names of the stored files
+        encoder {dict} -- encoder returned by get_encoder
+
+    Returns:
+        tuple -- Dataframe of the sentences with their file and array of their vectors
+    """
+    key = _corpus_key(names, encoder)
+    if key not in _corpus:
+        all_sentances = [pd.DataFrame(columns=["Sentance", "Page", "File"])]
+        all_vectors = [encode(encoder["model"], [])]
+        for name in names:
+            loaded = _load_file_vectors(name, encoder)
+            if loaded is None and storage.load_pages(name) is not None:
+                loaded = get_file_vectors(name, storage.load_pages(name), encoder)
+            if loaded is not None:
+                all_sentances.append(loaded[0].assign(File=name))
+                all_vectors.append(loaded[1])
+
+        _corpus.clear()
+        key = _corpus_key(names, encoder)  # Vectors computed above changed the key
+        _corpus[key] = (
+            pd.concat(all_sentances, ignore_index=True, sort=False),
+            np.vstack(all_vectors),
+        )
+    return _corpus[key]
+
+
+def get_corpus_index(names, encoder, word):
+    """Get an index over the sentences of several stored files containing a word
+
+    The index is kept in memory until the vectors of one of the files change.
+
+    Arguments:
+        names {list} -- names of the stored files
+        encoder {dict} -- encoder returned by get_encoder
+        word {str} -- word the indexed sentences contain
+
+    Returns:
+        tuple -- Dataframe of the indexed sentences with their file and the index
+    """
+    sentances, vectors = get_corpus_vectors(names, encoder)
+    key = (word,) + _corpus_key(names, encoder)
+    if key not in _corpus_index:
+        for stale in [i for i in _corpus_index if i[0] == word]:
+            del _corpus_index[stale]
+        mask = has_words(sentances, word)
+        _corpus_index[key] = (
+            sentances[mask].reset_index(drop=True),
+            build_index(vectors[mask]),
+        )
+    return _corpus_index[key]
+
+
+def has_words(sentances, word):
+    """Get the mask of the sentences containing a word
+
+    Arguments:
+        sentances {DataFrame} -- Dataframe returned by get_sentances
+        word {str} -- word to look for
+
+    Returns:
+        np.ndarray -- Boolean mask of the sentences
+    """
+    word = word.strip().lower()
+    return np.array([word in tokenize(i) for i in sentances["Sentance"]], dtype=bool)
+
+
+def get_semantic_matches(
+    sentances_1, vectors_1, sentances_2, vectors_2, min_similarity=0.7
+):
+    """Find the closest sentence of the second group for every sentence of the first
+
+    Arguments:
+        sentances_1 {DataFrame} -- Dataframe of first group of sentences
+        vectors_1 {np.ndarray} -- Vectors of the first group of sentences
+        sentances_2 {DataFrame} -- Dataframe of second group of sentences
+        vectors_2 {np.ndarray} -- Vectors of the second group of sentences
+
+    Keyword Arguments:
+        min_similarity {float} -- minimum cosine similarity of a match
+
+    Returns:
+        Dataframe -- Dataframe of all similar sentences and their pages
+    """
+    if len(vectors_2) == 0:
+        scores = np.full(len(vectors_1), -np.inf, dtype=np.float32)
+        ids = np.full(len(vectors_1), -1)
+    else:
+        similarities = vectors_1 @ vectors_2.T
+        ids = similarities.argmax(axis=1)
+        scores = similarities[np.arange(len(ids)), ids]
+    return _matches_to_frame(
+        sentances_1, sentances_2, scores, ids, min_similarity, prefix="File 2"
+    )
+
+
+def get_semantic_comparison(name_1, pages_1, name_2, pages_2, words, min_similarity):
+    """Semantically compare the sentences of two files containing the given words
+
+    Arguments:
+        name_1 {str} -- Name of the first file
+        pages_1 {list} -- list of first set of pages
+        name_2 {str} -- Name of the second file
+        pages_2 {list} -- list of second set of pages
+        words {list} -- list of words to be included in the search
+        min_similarity {float} -- minimum cosine similarity of a match
+
+    Returns:
+        dict -- dictionary of results, None if the sentence encoder could not be fitted
+    """
+    encoder = get_encoder(pages_1)
+    if encoder is None:
+        return None
+    sentances_1, vectors_1 = get_file_vectors(name_1, pages_1, encoder)
+    sentances_2, vectors_2 = get_file_vectors(name_2, pages_2, encoder)
+
+    results = {}
+    for word in words:
+        mask_1 = has_words(sentances_1, word)
+        mask_2 = has_words(sentances_2, word)
+        results[word] = get_semantic_matches(
+            sentances_1[mask_1].reset_index(drop=True),
+            vectors_1[mask_1],
+            sentances_2[mask_2].reset_index(drop=True),
+            vectors_2[mask_2],
+            min_similarity,
+        )
+    return results
+
+
+def get_corpus_comparison(name, pages, words, min_similarity):
+    """Find the closest requirement in the corpus of the other stored files
+
+    The sentences of the file containing a word are compared with the sentences of
+    the other files containing the same word.
+
+    Arguments:
+        name {str} -- Name of the file
+        pages {list} -- list of pages of the file
+        words {list} -- list of words to be included in the search
+        min_similarity {float} -- minimum cosine similarity of a match
+
+    Returns:
+        dict -- dictionary of results, None if the sentence encoder could not be fitted
+    """
+    names = [i for i in storage.load_file_names() if i != name]
+    encoder = get_encoder(pages)
+    if encoder is None:
+        return None
+    sentances, vectors = get_file_vectors(name, pages, encoder)
+
+    results = {}
+    for word in words:
+        corpus_sentances, index = get_corpus_index(names, encoder, word)
+        mask = has_words(sentances, word)
+        scores, ids = search_index(index, vectors[mask])
+        results[word] = _matches_to_frame(
+            sentances[mask].reset_index(drop=True),
+            corpus_sentances,
+            scores,
+            ids,
+            min_similarity,
+        )
+    return results
+
+
+def _matches_to_frame(
+    sentances_1, sentances_2, scores, ids, min_similarity, prefix="Matched"
+):
+    found = np.nonzero((ids >= 0) & (scores >= min_similarity))[0]
+    matches = sentances_2.iloc[ids[found]]
+    df = pd.DataFrame(
+        {
+            "File 1 Sentance": sentances_1["Sentance"].iloc[found].values,
+            "File 1 Page": sentances_1["Page"].iloc[found].values,
+        }
+    )
+    if "File" in matches:
+        df[f"{prefix} File"] = matches["File"].values
+    df[f"{prefix} Sentance"] = matches["Sentance"].values
+    df[f"{prefix} Page"] = matches["Page"].values
+    df["Similarity"] = scores[found].round(3)
+    return df
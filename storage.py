@@ -0,0 +1,430 @@
+import json
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+BACKUP_FILE = "db.json"  # Legacy store holding the pages of every file
+CLASS_MAPPER = "class.json"  # Catalog of the class name -> file names
+DOCUMENT_DIR = "documents"  # One json file per stored file
+MIGRATION_MARKER = os.path.join(DOCUMENT_DIR, ".migrated")  # Backup already split
+ENCODER_FILE = os.path.join(DOCUMENT_DIR, "encoder.pkl")  # Shared sentence encoder
+# Results of the page level analyses, bump the version when an analysis changes
+PAGE_RESULTS_FILE = os.path.join(DOCUMENT_DIR, "page_results.v1.sqlite")
+MAX_PAGE_RESULTS = 5000  # Page results also kept in memory
+
+_pages = {}  # Pages read during this process, shared between reruns and sessions
+_cooccurrences = {}  # Co-occurrences read during this process with their version
+_migrated = False
+_page_results = OrderedDict()  # Least recently used page results
+_page_stores = {}  # Connection to the page result store of every directory
+_page_lock = threading.Lock()
+
+
+def _document_path(name, kind="pages", extension="json"):
+    return os.path.join(DOCUMENT_DIR, f"{quote(name, safe='')}.{kind}.{extension}")
+
+
+def _read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w+") as f:
+        json.dump(data, f)
+
+
+def hash_page(page):
+    """Hash the content of a page
+
+    Arguments:
+        page {string} -- page to hash
+
+    Returns:
+        string -- hex digest of the page
+    """
+    return hashlib.sha1(page.encode("utf-8")).hexdigest()
+
+
+def _analysis_key(func, args):
+    return f"{func.__module__}.{func.__qualname__}{args!r}"
+
+
+def _page_store():
+    import sqlite3
+
+    path = os.path.abspath(PAGE_RESULTS_FILE)
+    if path not in _page_stores:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        store = sqlite3.connect(path, check_same_thread=False)
+        store.execute(
+            "CREATE TABLE IF NOT EXISTS results"
+            " (analysis TEXT, page TEXT, result BLOB, PRIMARY KEY (analysis, page))"
+        )
+        _page_stores[path] = store
+    return _page_stores[path]
+
+
+def map_pages(func, pages, *args, store=True, batched=False):
+    """Apply a page level analysis to every page, reusing the results of known pages.
+
+    Results are keyed on the analysis, its arguments and the hash of the page, so a
+    revised file only analyses the pages whose content changed. They are kept in
+    memory and saved with the documents for later processes. The results are shared
+    and must not be modified.
+
+    Arguments:
+        func {function} -- function taking a page and args, returning a picklable result
+        pages {list} -- list of pages
+
+    Keyword Arguments:
+        store {bool} -- save the results to disk, not only in memory
+        batched {bool} -- func takes the list of pages to analyse and returns the list
+            of their results, for analyses faster on many pages at once
+
+    Returns:
+        list -- list of the results of every page
+    """
+    import pickle
+
+    analysis = _analysis_key(func, args)
+    hashes = [hash_page(i) for i in pages]
+    results = {}
+    with _page_lock:
+        for page_hash in hashes:
+            if (analysis, page_hash) in _page_results:
+                _page_results.move_to_end((analysis, page_hash))
+                results[page_hash] = _page_results[analysis, page_hash]
+        if store:
+            for page_hash in set(hashes).difference(results):
+                row = (
+                    _page_store()
+                    .execute(
+                        "SELECT result FROM results WHERE analysis = ? AND page = ?",
+                        (analysis, page_hash),
+                    )
+                    .fetchone()
+                )
+                if row is not None:
+                    results[page_hash] = pickle.loads(row[0])
+
+    missing = {}
+    for page, page_hash in zip(pages, hashes):
+        if page_hash not in results:
+            missing.setdefault(page_hash, page)
+    if batched and missing:
+        computed = dict(zip(missing, func(list(missing.values()), *args)))
+    else:
+        computed = {i: func(page, *args) for i, page in missing.items()}
+
+    with _page_lock:
+        if store and computed:
+            _page_store().executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                [(analysis, i, pickle.dumps(j)) for i, j in computed.items()],
+            )
+            _page_store().commit()
+        results.update(computed)
+        for page_hash, result in results.items():
+            _page_results[analysis, page_hash] = result
+            _page_results.move_to_end((analysis, page_hash))
+        while len(_page_results) > MAX_PAGE_RESULTS:
+            _page_results.popitem(last=False)
+    return [results[i] for i in hashes]
+
+
+def clear_page_results(func):
+    """Remove the results of a page level analysis, whatever its arguments were.
+
+    Arguments:
+        func {function} -- function given to map_pages
+    """
+    prefix = f"{func.__module__}.{func.__qualname__}("
+    with _page_lock:
+        for key in [i for i in _page_results if i[0].startswith(prefix)]:
+            del _page_results[key]
+        if os.path.exists(PAGE_RESULTS_FILE):
+            _page_store().execute(
+                "DELETE FROM results WHERE substr(analysis, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+            _page_store().commit()
+
+
+def _migrate_backup():
+    """Split the legacy backup file into one file per document.
+
+    Only runs the first time a file is missing from DOCUMENT_DIR, a marker is then
+    written so later processes never have to read the whole backup again.
+    """
+    global _migrated
+    if _migrated or os.path.exists(MIGRATION_MARKER):
+        _migrated = True
+        return
+    for name, pages in _read_json(BACKUP_FILE, {}).items():
+        if not os.path.exists(_document_path(name)):
+            _write_json(_document_path(name), pages)
+    _write_json(MIGRATION_MARKER, BACKUP_FILE)
+    _migrated = True
+
+
+def load_catalog():
+    """Load the catalog of stored files without reading any of their pages.
+
+    Returns:
+        dict -- Dictionary in the format {Class: [File Name]}
+    """
+    return _read_json(CLASS_MAPPER, {})
+
+
+def load_file_names():
+    """Get the names of every file in the catalog.
+
+    Returns:
+        list -- list of file names
+    """
+    names = []
+    for class_names in load_catalog().values():
+        names.extend(i for i in class_names if i not in names)
+    return names
+
+
+def save_catalog(cm):
+    """Save the catalog of stored files.
+
+    Arguments:
+        cm {dict} -- Dictionary in the format {Class: [File Name]}
+    """
+    _write_json(CLASS_MAPPER, cm)
+
+
+def load_pages(name):
+    """Load the pages of a stored file, reading it from disk only once.
+
+    Arguments:
+        name {str} -- Name of the file
+
+    Returns:
+        list -- List of all pages in the file, None if the file is not stored
+    """
+    if name not in _pages:
+        if not os.path.exists(_document_path(name)):
+            _migrate_backup()
+        pages = _read_json(_document_path(name))
+        if pages is None:
+            return None
+        _pages[name] = pages
+    return _pages[name]
+
+
+def save_pages(name, pages):
+    """Save the pages of a file if they differ from the stored ones.
+
+    The statistics and vectors of the whole file are removed, they are assembled
+    again from the saved results of its pages (see map_pages) so only the changed
+    pages are analysed. The stored pages become the previous revision of the file,
+    pages which are no longer used are kept in an archive so every revision can be
+    rebuilt.
+
+    Arguments:
+        name {str} -- Name of the file
+        pages {list} -- List of all pages in the file
+
+    Returns:
+        bool -- True if the pages were written
+    """
+    previous = load_pages(name)
+    if previous == pages:
+        return False
+
+    if previous is not None:
+        hashes = [hash_page(i) for i in pages]
+        revisions = load_revisions(name)
+        kept = set(hashes)
+        removed = {
+            page_hash: page
+            for page_hash, page in zip(map(hash_page, previous), previous)
+            if page_hash not in kept
+        }
+        if removed:
+            archive = _read_json(_document_path(name, "archive"), {})
+            archive.update(removed)
+            _write_json(_document_path(name, "archive"), archive)
+        _write_json(_document_path(name, "revisions"), revisions + [hashes])
+
+    _write_json(_document_path(name), pages)
+    _pages[name] = pages
+    for path in [_document_path(name, "assoc"), _document_path(name, "vectors", "npz")]:
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+
+def load_revisions(name):
+    """Load the page hashes of every revision of a stored file.
+
+    Arguments:
+        name {str} -- Name of the file
+
+    Returns:
+        list -- list of the page hashes of every revision, oldest first
+    """
+    revisions = _read_json(_document_path(name, "revisions"))
+    if revisions is None:
+        pages = load_pages(name)
+        revisions = [] if pages is None else [[hash_page(i) for i in pages]]
+    return revisions
+
+
+def load_revision_pages(name, revision):
+    """Rebuild the pages of a revision of a stored file.
+
+    Arguments:
+        name {str} -- Name of the file
+        revision {int} -- Index of the revision in load_revisions
+
+    Returns:
+        list -- List of all pages in the revision
+    """
+    current = {hash_page(i): i for i in load_pages(name)}
+    hashes = load_revisions(name)[revision]
+    if all(i in current for i in hashes):
+        return [current[i] for i in hashes]
+    archive = _read_json(_document_path(name, "archive"), {})
+    return [current[i] if i in current else archive[i] for i in hashes]
+
+
+def load_cooccurrences(name):
+    """Load the precomputed co-occurrence statistics of a stored file.
+
+    Arguments:
+        name {str} -- Name of the file
+
+    Returns:
+        dict -- Co-occurrence statistics, None if they were never computed
+    """
+    version = cooccurrences_version(name)
+    if version is None:
+        return None
+    if _cooccurrences.get(name, (None,))[0] != version:
+        _cooccurrences[name] = version, _read_json(_document_path(name, "assoc"))
+    return _cooccurrences[name][1]
+
+
+def cooccurrences_version(name):
+    """Get the modification time of the saved co-occurrence statistics of a file.
+
+    Arguments:
+        name {str} -- Name of the file
+
+    Returns:
+        float -- Modification time, None if the statistics were never computed
+    """
+    path = _document_path(name, "assoc")
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def has_cooccurrences(name):
+    """Check if the co-occurrence statistics of a stored file were computed.
+
+    Arguments:
+        name {str} -- Name of the file
+
+    Returns:
+        bool -- True if the statistics were saved
+    """
+    return os.path.exists(_document_path(name, "assoc"))
+
+
+def save_cooccurrences(name, stats):
+    """Save the co-occurrence statistics of a file.
+
+    Arguments:
+        name {str} -- Name of the file
+        stats {dict} -- Co-occurrence statistics
+    """
+    _write_json(_document_path(name, "assoc"), stats)
+
+
+def load_vectors(name):
+    """Load the sentence vectors of a stored file.
+
+    Arguments:
+        name {str} -- Name of the file
+
+    Returns:
+        dict -- Arrays saved with save_vectors, None if they were never computed
+    """
+    import numpy as np
+
+    path = _document_path(name, "vectors", "npz")
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def save_vectors(name, **arrays):
+    """Save the sentence vectors of a file, they are removed when its pages change.
+
+    Arguments:
+        name {str} -- Name of the file
+        arrays {np.ndarray} -- Arrays to save
+    """
+    import numpy as np
+
+    os.makedirs(DOCUMENT_DIR, exist_ok=True)
+    np.savez(_document_path(name, "vectors", "npz"), **arrays)
+
+
+def vectors_version(name):
+    """Get the modification time of the saved sentence vectors of a file.
+
+    Arguments:
+        name {str} -- Name of the file
+
+    Returns:
+        float -- Modification time, None if the vectors were never computed
+    """
+    path = _document_path(name, "vectors", "npz")
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def clear_vectors():
+    """Remove the sentence vectors of every file."""
+    if os.path.exists(DOCUMENT_DIR):
+        for filename in os.listdir(DOCUMENT_DIR):
+            if filename.endswith(".vectors.npz"):
+                os.remove(os.path.join(DOCUMENT_DIR, filename))
+
+
+def load_encoder():
+    """Load the sentence encoder shared by every file.
+
+    Returns:
+        dict -- Encoder saved with save_encoder, None if it was never fitted
+    """
+    import pickle
+
+    if not os.path.exists(ENCODER_FILE):
+        return None
+    with open(ENCODER_FILE, "rb") as f:
+        return pickle.load(f)
+
+
+def save_encoder(encoder):
+    """Save the sentence encoder shared by every file.
+
+    Arguments:
+        encoder {dict} -- Encoder to save
+    """
+    import pickle
+
+    os.makedirs(DOCUMENT_DIR, exist_ok=True)
+    with open(ENCODER_FILE, "wb") as f:
+        pickle.dump(encoder, f)
@@ -0,0 +1,55 @@
+import math
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("pandas")
+
+import analytics  # noqa: E402
+
+
+def test_whole_words_only():
+    stats = analytics.count_cooccurrences(
+        ["The mustard jar.\nThe pump must run.\nMustard must be yellow."], ["must"]
+    )
+    assert stats["targets"]["must"]["sentances"] == 2
+    words = analytics.top_associated_words(stats, "must", min_count=1)
+    assert set(words["Word"]) == {"pump", "run", "mustard", "yellow"}
+    assert dict(zip(words["Word"], words["Count"]))["mustard"] == 1
+
+
+def test_merge_remaps_token_ids():
+    stats_1 = analytics.count_cooccurrences(["The pump must run."], ["must"])
+    stats_2 = analytics.count_cooccurrences(
+        ["The valve must open.\nThe pump must stop."], ["must"]
+    )
+    merged = analytics.merge_cooccurrences([stats_1, stats_2])
+
+    assert merged["sentances"] == 3
+    assert merged["targets"]["must"]["sentances"] == 3
+    pairs = {
+        merged["vocab"][i]: count for i, count in merged["targets"]["must"]["pairs"]
+    }
+    assert pairs == {"pump": 2, "run": 1, "valve": 1, "open": 1, "stop": 1}
+    term_counts = dict(zip(merged["vocab"], merged["term_counts"]))
+    assert term_counts["pump"] == 2
+    assert term_counts["valve"] == 1
+
+
+def test_scores_of_a_2x2_table():
+    # 10 sentences, the word is in 4, the term in 5 and both in 3 (2 expected)
+    assert analytics._pmi(3, 4, 5, 10) == pytest.approx(math.log(1.5))
+    g2 = 2 * (
+        3 * math.log(3 * 10 / (4 * 5))
+        + 1 * math.log(1 * 10 / (4 * 5))
+        + 2 * math.log(2 * 10 / (6 * 5))
+        + 4 * math.log(4 * 10 / (6 * 5))
+    )
+    assert analytics._log_likelihood(3, 4, 5, 10) == pytest.approx(g2)
+    assert g2 == pytest.approx(1.726092, abs=1e-6)
+
+
+def test_scores_are_negative_below_expectation():
+    assert analytics._pmi(1, 4, 5, 10) < 0
+    assert analytics._log_likelihood(1, 4, 5, 10) < 0
+    assert analytics._log_likelihood(2, 4, 5, 10) == pytest.approx(0)
@@ -0,0 +1,72 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME_BUDGET = 3.0  # Seconds to import the startup dependencies of tool.py
+HEAVY_MODULES = ["plotly", "sklearn", "scipy", "pandas"]
+
+STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+import streamlit, utils, storage, base64
+storage.load_catalog()
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": list(sys.modules)}))
+"""
+
+
+def top_level_imports(name, seen=None):
+    """Get the modules imported by the body of a local module and its local imports"""
+    seen = set() if seen is None else seen
+    seen.add(name)
+    with open(os.path.join(ROOT, f"{name}.py")) as f:
+        tree = ast.parse(f.read())
+
+    imported = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules = [i.name for i in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            root = module.split(".")[0]
+            imported.add(root)
+            if root not in seen and os.path.exists(os.path.join(ROOT, f"{root}.py")):
+                imported |= top_level_imports(root, seen)
+    return imported
+
+
+@pytest.mark.parametrize("module", HEAVY_MODULES)
+def test_tool_does_not_import_heavy_modules(module):
+    assert module not in top_level_imports("tool")
+
+
+@pytest.fixture(scope="module")
+def startup(tmp_path_factory):
+    pytest.importorskip("streamlit")
+    # Run from a file, st.cache hashes the directory of the main script
+    script = tmp_path_factory.mktemp("startup") / "startup.py"
+    script.write_text(f"import sys\nsys.path.insert(0, {ROOT!r})\n{STARTUP}")
+    output = subprocess.run(
+        [sys.executable, str(script)],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", HEAVY_MODULES)
+def test_startup_does_not_import_heavy_modules(startup, module):
+    assert module not in startup["modules"]
+
+
+def test_startup_import_time_budget(startup):
+    assert startup["seconds"] < IMPORT_TIME_BUDGET
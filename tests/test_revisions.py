@@ -0,0 +1,127 @@
+import pytest
+
+import storage
+
+PAGE_1 = "Section 1 Scope\nThe pump must run at night.\nThe tank is blue."
+PAGE_2 = "Section 2 Safety\nThe operator shall wear gloves.\nNo smoking."
+PAGE_3 = "Section 3 Delivery\nThe supplier should deliver within 30 days."
+
+
+@pytest.fixture(autouse=True)
+def clean_storage(monkeypatch):
+    monkeypatch.setattr(storage, "_pages", {})
+    monkeypatch.setattr(storage, "_cooccurrences", {})
+    monkeypatch.setattr(storage, "_migrated", False)
+    monkeypatch.setattr(storage, "_page_results", storage.OrderedDict())
+
+
+def test_revisions_round_trip():
+    assert storage.save_pages("spec", [PAGE_1, PAGE_2])
+    assert not storage.save_pages("spec", [PAGE_1, PAGE_2])
+    assert storage.save_pages("spec", [PAGE_2, PAGE_3])
+    assert storage.save_pages("spec", [PAGE_3, PAGE_3, PAGE_1])
+
+    storage._pages.clear()  # As in a new process
+    revisions = storage.load_revisions("spec")
+    assert len(revisions) == 3
+    assert storage.load_revision_pages("spec", 0) == [PAGE_1, PAGE_2]
+    assert storage.load_revision_pages("spec", 1) == [PAGE_2, PAGE_3]
+    assert storage.load_revision_pages("spec", 2) == [PAGE_3, PAGE_3, PAGE_1]
+    assert storage.load_pages("spec") == [PAGE_3, PAGE_3, PAGE_1]
+
+
+def test_unrevised_file_is_its_only_revision():
+    storage.save_pages("spec", [PAGE_1])
+    assert storage.load_revisions("spec") == [[storage.hash_page(PAGE_1)]]
+    assert storage.load_revisions("unknown") == []
+
+
+def test_page_results_are_saved_and_only_new_pages_analysed():
+    analysed = []
+
+    def count_lines(page):
+        analysed.append(page)
+        return page.count("\n")
+
+    assert storage.map_pages(count_lines, [PAGE_1, PAGE_2, PAGE_1]) == [2, 2, 2]
+    assert analysed == [PAGE_1, PAGE_2]
+
+    storage._page_results.clear()  # As in a new process
+    assert storage.map_pages(count_lines, [PAGE_2, PAGE_3]) == [2, 1]
+    assert analysed == [PAGE_1, PAGE_2, PAGE_3]
+
+    storage.clear_page_results(count_lines)
+    storage.map_pages(count_lines, [PAGE_1])
+    assert analysed[-1] == PAGE_1
+
+
+def test_batched_analysis_gets_the_new_pages_once():
+    batches = []
+
+    def count_lines(pages):
+        batches.append(pages)
+        return [page.count("\n") for page in pages]
+
+    storage.map_pages(count_lines, [PAGE_1], batched=True)
+    results = storage.map_pages(
+        count_lines, [PAGE_2, PAGE_1, PAGE_3, PAGE_2], batched=True
+    )
+    assert results == [2, 2, 1, 2]
+    assert batches == [[PAGE_1], [PAGE_2, PAGE_3]]
+
+
+def test_unsaved_page_results_stay_in_memory():
+    storage.map_pages(len, [PAGE_1], store=False)
+    storage._page_results.clear()
+    analysed = []
+    storage.map_pages(lambda page: analysed.append(page), [PAGE_1], store=False)
+    assert analysed == [PAGE_1]
+
+
+class TestRequirementDiff:
+    @pytest.fixture(autouse=True)
+    def analytics(self):
+        pytest.importorskip("streamlit")
+        pytest.importorskip("pandas")
+        import analytics
+
+        return analytics
+
+    def diff(self, analytics, old_pages, new_pages):
+        results = analytics.get_requirement_diff(
+            old_pages, new_pages, ["should", "must", "shall"]
+        )
+        return {
+            change: sorted(map(tuple, df.values.tolist()))
+            for change, df in results.items()
+        }
+
+    def test_added_removed_and_changed(self, analytics):
+        new_page_1 = PAGE_1.replace("at night", "at night and day")
+        results = self.diff(analytics, [PAGE_1, PAGE_2], [new_page_1, PAGE_3])
+
+        assert results["added"] == [
+            ("The supplier should deliver within 30 days.", 2)
+        ]
+        assert results["removed"] == [("The operator shall wear gloves.", 2)]
+        assert results["changed"] == [
+            (
+                "The pump must run at night.",
+                1,
+                "The pump must run at night and day.",
+                1,
+                pytest.approx(0.871, abs=1e-3),
+            )
+        ]
+
+    def test_reordered_pages_are_unchanged(self, analytics):
+        results = self.diff(analytics, [PAGE_1, PAGE_2, PAGE_3], [PAGE_3, PAGE_1, PAGE_2])
+        assert not any(results.values())
+
+    def test_duplicated_pages_are_added(self, analytics):
+        results = self.diff(analytics, [PAGE_1, PAGE_2], [PAGE_1, PAGE_2, PAGE_2])
+        assert results["added"] == [("The operator shall wear gloves.", 3)]
+        assert not results["removed"] and not results["changed"]
+
+        results = self.diff(analytics, [PAGE_1, PAGE_1], [PAGE_1])
+        assert results["removed"] == [("The pump must run at night.", 2)]
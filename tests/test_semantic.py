@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import semantic  # noqa: E402
+
+
+def unit_vectors(n, dim=16, seed=0):
+    vectors = np.random.RandomState(seed).randn(n, dim).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_search_probing_every_list_is_exact():
+    vectors = unit_vectors(200)
+    queries = unit_vectors(30, seed=1)
+    index = semantic.build_index(vectors)
+
+    scores, ids = semantic.search_index(index, queries, n_probe=len(index["lists"]))
+
+    similarities = queries @ vectors.T
+    assert (ids == similarities.argmax(axis=1)).all()
+    assert scores == pytest.approx(similarities.max(axis=1), abs=1e-6)
+
+
+def test_search_empty_index():
+    index = semantic.build_index(unit_vectors(0))
+
+    scores, ids = semantic.search_index(index, unit_vectors(3))
+
+    assert (ids == -1).all()
+    assert len(scores) == 3
+
+
+def test_semantic_matches_are_exact():
+    vectors_1 = unit_vectors(5)
+    vectors_2 = np.vstack([unit_vectors(20, seed=1), vectors_1[2:3]])
+    sentances_1 = pd.DataFrame({"Sentance": list("abcde"), "Page": [1] * 5})
+    sentances_2 = pd.DataFrame({"Sentance": [str(i) for i in range(21)], "Page": 2})
+
+    matches = semantic.get_semantic_matches(
+        sentances_1, vectors_1, sentances_2, vectors_2, min_similarity=0.99
+    )
+
+    assert matches["File 1 Sentance"].tolist() == ["c"]
+    assert matches["File 2 Sentance"].tolist() == ["20"]
+    empty = semantic.get_semantic_matches(
+        sentances_1, vectors_1, sentances_2.iloc[:0], vectors_2[:0]
+    )
+    assert empty.empty
+
+
+@pytest.mark.parametrize(
+    "sentances", [[], ["the and of", "it is"], ["pump pump", "pump"], ["one pump"]]
+)
+def test_fit_encoder_needs_two_sentences_and_words(sentances):
+    with pytest.raises(ValueError):
+        semantic.fit_encoder(sentances)
@@ -1,32 +1,13 @@
 import streamlit as st
-from analytics import (
-    get_words_in_sentances,
-    get_headers,
-    get_frequent_words,
-    get_comparison_similar_words,
-    get_figures_tables,
-    run_query,
-    get_money,
-    get_associated_words,
-)
-from utils import read_pdf_file, get_sections
+from utils import read_pdf_file, get_sections, REQUIREMENT_WORDS
+import storage
 import base64
-import pickle
-import os
-import json
-import plotly.graph_objs as go
-import pandas as pd
 
-BACKUP_FILE = "db.json"
-CLASS_MAPPER = "class.json"
+# Only the catalog of files is read on startup, the pages of a file are loaded when
+# it is selected and the analytics (pandas, plotly, scikit-learn, scipy) are imported
+# by the tools that use them.
+cm = storage.load_catalog()
 
-db = {}
-cm = {}
-if os.path.exists(BACKUP_FILE):
-    db = json.load(open(BACKUP_FILE, "r+"))
-
-if os.path.exists(CLASS_MAPPER):
-    cm = json.load(open(CLASS_MAPPER, "r+"))
 
 TOOL_OPTIONS = [
     "Should, Shall, Must",
@@ -37,10 +18,14 @@ TOOL_OPTIONS = [
     "Scored Query",
     "Scored Should, Shall, Must",
     "Price Search",
+    "Corpus Comparison",
+    "Revision Diff",
 ]
 
 COMPARE_OPTIONS = ["Should, Shall, Must", "Query Comparison"]
 
+COMPARE_ENGINES = ["Word Count", "Semantic"]
+
 DOWNLOAD_BUTTON_STYLE = """
     background-color:#37a879;
     border-radius:28px;
@@ -95,6 +80,8 @@ def display_words(word_dict, fig=False, target=None, key_incr=0):
 
 
 def plot_distributions(df, target):
+    import plotly.graph_objs as go
+
     if df.shape[0] > 0 and df.shape[1] > 0:
         df[target] = df[target].apply(lambda x: " ".join(x.split()[:2]))
         new_df = df[target].value_counts() / df.shape[0]
@@ -119,6 +106,85 @@ def plot_distributions(df, target):
         st.write(fig)
 
 
+def get_file_cooccurrences(name, pages):
+    """Get the requirement word co-occurrences of a file, precomputed if it was saved.
+
+    Arguments:
+        name {str} -- Name of the file
+        pages {list} -- list of pages of the file
+
+    Returns:
+        dict -- Co-occurrence statistics of the file
+    """
+    from analytics import count_cooccurrences
+
+    stored = storage.load_pages(name) == pages
+    stats = storage.load_cooccurrences(name) if stored else None
+    if stats is None:
+        stats = count_cooccurrences(pages, REQUIREMENT_WORDS)
+        if stored:
+            storage.save_cooccurrences(name, stats)
+    return stats
+
+
+def save_file(name, pages):
+    """Save the pages of a file and compute its co-occurrences if they are missing.
+
+    Arguments:
+        name {str} -- Name of the file
+        pages {list} -- list of pages of the file
+    """
+    storage.save_pages(name, pages)
+    if not storage.has_cooccurrences(name):
+        get_file_cooccurrences(name, pages)
+
+
+def get_class_cooccurrences(class_name, name, pages):
+    """Merge the requirement word co-occurrences of every file in a class.
+
+    Arguments:
+        class_name {str} -- Name of the class
+        name {str} -- Name of the current file
+        pages {list} -- list of pages of the current file
+
+    Returns:
+        dict -- Co-occurrence statistics of the whole class
+    """
+    from analytics import merge_cooccurrences
+
+    names = []
+    for file_name in cm.get(class_name, []):
+        file_pages = storage.load_pages(file_name)
+        if file_pages is None or (file_name == name and file_pages != pages):
+            continue
+        if not storage.has_cooccurrences(file_name):
+            get_file_cooccurrences(file_name, file_pages)
+        names.append(file_name)
+
+    versions = tuple(storage.cooccurrences_version(i) for i in names)
+    stats = merge_class_cooccurrences(class_name, tuple(names), versions)
+    if name not in names:  # The current file is not saved yet
+        stats = merge_cooccurrences([stats, get_file_cooccurrences(name, pages)])
+    return stats
+
+
+@st.cache(allow_output_mutation=True)
+def merge_class_cooccurrences(class_name, names, versions):
+    """Merge the saved co-occurrences of the files of a class, cached on their versions.
+
+    Arguments:
+        class_name {str} -- Name of the class
+        names {tuple} -- Names of the files of the class
+        versions {tuple} -- Versions of the saved co-occurrences of the files
+
+    Returns:
+        dict -- Co-occurrence statistics of the whole class
+    """
+    from analytics import merge_cooccurrences
+
+    return merge_cooccurrences([storage.load_cooccurrences(i) for i in names])
+
+
 def download_button(df, filename="download"):
     csv = df.to_csv()
     b64 = base64.b64encode(
@@ -141,7 +207,7 @@ def get_pages_ui(key=1):
     if file_mode == "PDF":
         mode = st.selectbox(
             "Selection Mode",
-            ["New File", "Existing File"] if db else ["New File"],
+            ["New File", "Existing File"] if cm else ["New File"],
             key=f"selection_{key}",
         )
         if mode == "New File":
@@ -155,13 +221,14 @@ def get_pages_ui(key=1):
             uploaded_file = st.file_uploader(
                 "Choose a PDF file", type="pdf", key=f"file_uploader_{key}"
             )
+            if name in storage.load_file_names():
+                st.warning(f"{name} already exists, the upload will be a new revision")
             if uploaded_file is not None:
                 pages = get_pages(uploaded_file)
                 _, sections = get_sections(pages)
 
         else:
-            count_class = {i: len(j) for i, j in cm.items()}
-            st.write(pd.Series(count_class, name="Count"))
+            st.table([{"Class": i, "Count": len(j)} for i, j in cm.items()])
             uploaded_class = st.selectbox(
                 "Previous File Class", sorted(list(cm.keys())), key=f"class_name_{key}"
             )
@@ -173,7 +240,7 @@ def get_pages_ui(key=1):
                     key=f"file_name_{key}",
                 )
                 if file_name:
-                    pages = db[file_name]
+                    pages = storage.load_pages(file_name)
                     _, sections = get_sections(pages)
                     name = file_name
     else:
@@ -187,6 +254,8 @@ def get_pages_ui(key=1):
             "Choose a Excel file", type="xlsm", key=f"file_uploader_{key}"
         )
         if uploaded_file is not None:
+            import pandas as pd
+
             pages = list(
                 pd.read_excel(uploaded_file).iloc[:, 1].astype(str).values.reshape(-1)
             )
@@ -194,7 +263,7 @@ def get_pages_ui(key=1):
     st.markdown("________")
     if pages:
         st.info(
-            f"**Insights on {name}** \n* **Class**: {uploaded_class} \n * **# of Pages**: {len(pages)} \n  * **# of Sections**: {len(set(sections.values()))}"
+            f"**Insights on {name}** \n* **Class**: {uploaded_class} \n * **# of Pages**: {len(pages)} \n  * **# of Sections**: {len(set(sections.values()))} \n  * **# of Revisions**: {len(storage.load_revisions(name))}"
         )
     return pages, sections, name, uploaded_class
 
@@ -230,9 +299,11 @@ if pages is not None and name:
         "Choose Tool Output", options=TOOL_OPTIONS, key="first_file_mulit"
     )
     if multi_select == TOOL_OPTIONS[0]:
-        word_results = get_words_in_sentances(
-            pages, ["should", "must", "shall"], sections_1
-        )
+        from analytics import get_words_in_sentances, get_associated_words, SCORERS
+        import plotly.graph_objs as go
+        import pandas as pd
+
+        word_results = get_words_in_sentances(pages, REQUIREMENT_WORDS, sections_1)
         d = pd.Series({i: j.shape[0] for i, j in word_results.items()})
         st.write(d)
         st.write(go.Figure(data=[go.Pie(labels=d.index, values=d.values)]))
@@ -240,10 +311,27 @@ if pages is not None and name:
         display_words(word_results, fig=True, target="Section")
         st.markdown("____")
         st.subheader("Associated Words")
-        display_words(get_associated_words(pages, ["should", "must", "shall"], sections_1), key_incr=3)
+        assoc_score = st.selectbox(
+            "Association Score", list(SCORERS), key="assoc_score"
+        )
+        assoc_count = st.slider("Associated Words Amount", 5, 100, 25, key="assoc_k")
+        if st.checkbox(f"Across all {class_name} files", key="assoc_class"):
+            stats = get_class_cooccurrences(class_name, name, pages)
+        else:
+            stats = get_file_cooccurrences(name, pages)
+        display_words(
+            get_associated_words(
+                pages, REQUIREMENT_WORDS, stats, assoc_count, assoc_score
+            ),
+            key_incr=3,
+        )
     elif multi_select == TOOL_OPTIONS[1]:
+        from analytics import get_headers
+
         display_result(get_headers(pages), "headers", "Headers")
     elif multi_select == TOOL_OPTIONS[2]:
+        from analytics import get_words_in_sentances
+
         st.header("Searching the PDF")
         st.warning(
             "Example Queries: **Safety, Dimension, Standard, Regulation, Ambient Temperature**"
@@ -253,12 +341,20 @@ if pages is not None and name:
             results = get_words_in_sentances(pages, [query])
             display_words(results)
     elif multi_select == TOOL_OPTIONS[3]:
+        from analytics import get_frequent_words
+
         word_results = get_frequent_words(pages)
         display_words(word_results)
     elif multi_select == TOOL_OPTIONS[4]:
+        from analytics import get_figures_tables
+
         word_results = get_figures_tables(pages, sections_1)
         display_words(word_results)
     elif multi_select == TOOL_OPTIONS[5]:
+        from analytics import run_query
+        import plotly.graph_objs as go
+        import pandas as pd
+
         query_count = st.slider("Query Amount", 2, 5, key="q_slider")
         all_queries = []
         for i in range(query_count):
@@ -273,6 +369,8 @@ if pages is not None and name:
         d = pd.Series(specific[display_selection])
         st.write(go.Figure(data=[go.Pie(labels=d.index, values=d.values, hole=0.6)]))
     elif multi_select == TOOL_OPTIONS[6]:
+        from analytics import run_query
+
         x = st.number_input("Must Coefficient", key="must_coef")
         y = st.number_input("Shall Coefficient", key="shall_coef")
         z = st.number_input("Should Coefficient", key="should_coef")
@@ -292,24 +390,77 @@ if pages is not None and name:
                 f"""Average X-Score: {res["Weight"].mean().round(2)}  \n  STD X-Score: {res["Weight"].std().round(2)}"""
             )
     elif multi_select == TOOL_OPTIONS[7]:
+        from analytics import get_money
+
         results = get_money(pages, sections_1)
         st.table(results)
+    elif multi_select == TOOL_OPTIONS[8]:
+        from semantic import get_corpus_comparison
+
+        st.header("Closest Requirement in the Corpus")
+        min_similarity = st.slider("Minimum Similarity", 0.0, 1.0, 0.7, key="sim_1")
+        results = get_corpus_comparison(name, pages, REQUIREMENT_WORDS, min_similarity)
+        if results is None:
+            st.warning("There is not enough text in the files to compare them")
+        else:
+            display_words(results, key_incr=4)
+    elif multi_select == TOOL_OPTIONS[9]:
+        from analytics import get_requirement_diff
+
+        st.header("Requirement Changes Between Revisions")
+        revisions = storage.load_revisions(name)
+        if storage.load_pages(name) == pages:
+            revisions = revisions[:-1]  # The selected pages are the latest revision
+        if not revisions:
+            st.warning(f"There is no previous revision of {name}")
+        else:
+            revision = st.selectbox(
+                "Compare with Revision",
+                list(range(len(revisions), 0, -1)),
+                key="revision_select",
+            )
+            old_pages = storage.load_revision_pages(name, revision - 1)
+            results = get_requirement_diff(old_pages, pages, REQUIREMENT_WORDS)
+            display_words(results, key_incr=5)
     st.write("_______")
     st.header("Comparing Different Files")
     pages_2, sections_2, name_2, class_name_2 = get_pages_ui(key=2)
 
     if pages_2 is not None and name_2 and class_name_2:
         multi_select_2 = st.selectbox(
-            "Choose Comparison Output", options=TOOL_OPTIONS, key="second_file_mulit"
+            "Choose Comparison Output", options=COMPARE_OPTIONS, key="second_file_mulit"
         )
 
         if multi_select_2 == COMPARE_OPTIONS[0]:
-            res = get_comparison_similar_words(pages, pages_2, ["should", "shall"],)
+            engine = st.selectbox("Comparison Engine", COMPARE_ENGINES, key="engine")
+            if engine == COMPARE_ENGINES[1]:
+                from semantic import get_semantic_comparison
+
+                min_similarity = st.slider(
+                    "Minimum Similarity", 0.0, 1.0, 0.7, key="sim_2"
+                )
+                res = get_semantic_comparison(
+                    name, pages, name_2, pages_2, ["should", "shall"], min_similarity
+                )
+                if res is None:
+                    st.warning(
+                        "There is not enough text in the files for the Semantic engine,"
+                        " the Word Count engine is used instead"
+                    )
+                    engine = COMPARE_ENGINES[0]
+            if engine == COMPARE_ENGINES[0]:
+                from analytics import get_comparison_similar_words
+
+                res = get_comparison_similar_words(pages, pages_2, ["should", "shall"],)
             display_words(
                 res, key_incr=1
             )
         elif multi_select_2 == COMPARE_OPTIONS[1]:
-            query = st.text_input("Please enter a query to search", key="query_input")
+            from analytics import get_words_in_sentances
+
+            query = st.text_input(
+                "Please enter a query to search", key="query_input_2"
+            )
             run_query = st.button("Run Query!", key="run_query")
             if query:
                 results = get_words_in_sentances(pages, [query])
@@ -318,11 +469,11 @@ if pages is not None and name:
         cm.setdefault(class_name_2, [])
         if name_2 not in cm[class_name_2]:
             cm[class_name_2].append(name_2)
+        save_file(name_2, pages_2)
 
     cm.setdefault(class_name, [])
     if name not in cm[class_name]:
         cm[class_name].append(name)
-    db[name] = pages
-    json.dump(db, open(BACKUP_FILE, "w+"))
-    json.dump(cm, open(CLASS_MAPPER, "w+"))
+    save_file(name, pages)
+    storage.save_catalog(cm)
 
@@ -1,13 +1,15 @@
 import re
-import pdftotext
 import streamlit as st
-import pandas as pd
-from scipy.spatial.distance import cosine
 from snowballstemmer import EnglishStemmer  # Use snowball stemming for turkish stemming
-from sklearn.feature_extraction.text import CountVectorizer
+from storage import map_pages
+
+# pdftotext, pandas, scipy and scikit-learn are imported inside the functions that
+# use them so that importing this module stays cheap on startup.
 
 engStem = EnglishStemmer()
 all_stopwords = []  # Add stopwords if needed.
+TOKEN_PATTERN = re.compile(r"\w+(?:'\w+)*")
+REQUIREMENT_WORDS = ["should", "must", "shall"]  # Words marking a requirement
 
 
 @st.cache
@@ -20,6 +22,20 @@ def clean_pdf_page(page):  # Cleans a pdftotext page
     return [re.sub("\s+", " ", i.strip()) for i in page.split("\n")]
 
 
+def tokenize(text):
+    """Split a text into lower case word tokens.
+
+    Unlike substring matching this keeps whole words apart ("must" != "mustard").
+
+    Arguments:
+        text {string} -- string to tokenize
+
+    Returns:
+        list -- list of tokens
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
 def read_pdf_file(file):
     """Converts a file to a pdftotext object
     
@@ -29,9 +45,25 @@ def read_pdf_file(file):
     Returns:
         pdftotext.PDF -- pdftotext representation of the file
     """
+    import pdftotext
+
     return pdftotext.PDF(file)
 
 
+def _find_section(page):
+    """Find the name of the section starting on a page, if any"""
+    clean_page = [re.sub("\s+", " ", i.strip()) for i in page.split("\n")]
+
+    for ind, i in enumerate(clean_page):
+        if (
+            re.findall("^Section \d+", i)
+            and "page" not in i
+            or (re.sub("\d+ [\w+\s+]+", "", i) == "" and ind == 0 and len(i) > 6)
+        ):
+            return i
+    return None
+
+
 @st.cache
 def get_sections(pages):
     """Get the different sections in a given page
@@ -47,25 +79,18 @@ def get_sections(pages):
     current_section_name = None
     current_section = []
 
-    for page_num, page in enumerate(pages):
-        clean_page = [re.sub("\s+", " ", i.strip()) for i in page.split("\n")]
-
-        for ind, i in enumerate(clean_page):
-
-            if (
-                re.findall("^Section \d+", i)
-                and "page" not in i
-                or (re.sub("\d+ [\w+\s+]+", "", i) == "" and ind == 0 and len(i) > 6)
-            ):
-                if current_section_name is not None:
-                    sections[current_section_name] = current_section
-                    current_section = []
-                current_section_name = i
-                break
+    for page_num, (page, section_name) in enumerate(
+        zip(pages, map_pages(_find_section, pages))
+    ):
+        if section_name is not None:
+            if current_section_name is not None:
+                sections[current_section_name] = current_section
+                current_section = []
+            current_section_name = section_name
 
         section_pages[page_num + 1] = current_section_name or "No Section"
 
-        current_section.extend(clean_page)
+        current_section.extend(re.sub("\s+", " ", i.strip()) for i in page.split("\n"))
     return sections, section_pages
 
 
@@ -80,6 +105,9 @@ def calculate_distance(df1, df2):
     Returns:
         Dataframe -- Dataframe containing the distances between the vectors
     """
+    import pandas as pd
+    from scipy.spatial.distance import cosine
+
     my_bar = st.progress(0)
     total_length = df1.shape[0] * df2.shape[0]
     incr = 0.0
@@ -105,6 +133,9 @@ def get_similar_sentences(df_1, df_2):
     Returns:
         Dataframe -- Dataframe of all similar words and word pages between the two texts
     """
+    import pandas as pd
+    from sklearn.feature_extraction.text import CountVectorizer
+
     cv = CountVectorizer(stop_words="english")
 
     cv.fit(pd.concat([df_1, df_2])["Sentance"])